@@ -0,0 +1,20 @@
+import json
+
+# payloads sent to Recode and CodeClient keep non-ASCII characters as \u escapes, whichever JSON library is installed
+_ascii_encoder = json.JSONEncoder(separators=(",", ":"))
+json_dumps_ascii = _ascii_encoder.encode
+
+try:
+    import orjson
+
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    # written as UTF-8 like orjson does, so the compressed templates are the same with and without it
+    # json.dumps builds a new encoder on every call when given non-default options
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def json_dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode()
+
+    json_loads = json.loads
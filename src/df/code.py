@@ -1,30 +1,84 @@
-from .enums import CodeBlockCategory, Selection, get_from_value
+import sys
+
+from ._compat import json_dumps
+from .enums import CodeBlockCategory, Selection, _CATEGORY_BY_VALUE, _SELECTION_BY_VALUE
 from .exceptions import MalformedCodeBlockJSONError
 from .values import ItemValue, BlockTag, Number, String
 
+def _to_item_value(value) -> ItemValue:
+    if isinstance(value, ItemValue):
+        return value
+    elif isinstance(value, (int, float)):
+        return Number(value)
+    elif isinstance(value, str):
+        return String(value)
+    return value
+
+class _ArgList(list):
+    """
+    A list of arguments that converts raw numbers and strings into ItemValues as they are added.
+    """
+    def __init__(self, values=()):
+        super().__init__(map(_to_item_value, values))
+
+    @classmethod
+    def _from_item_values(cls, values) -> '_ArgList':
+        # for values that are known to be ItemValues already, such as freshly deserialized ones
+        args = cls()
+        list.extend(args, values)
+        return args
+
+    def append(self, value):
+        super().append(_to_item_value(value))
+
+    def insert(self, index, value):
+        super().insert(index, _to_item_value(value))
+
+    def extend(self, values):
+        super().extend(map(_to_item_value, values))
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            super().__setitem__(index, map(_to_item_value, value))
+        else:
+            super().__setitem__(index, _to_item_value(value))
+
 class Block:
     """
     Represents a Block in a Template. You should not use this.
     """
+    __slots__ = ()
+
     def to_json(self) -> dict:
         pass
 
+    def _to_json_bytes(self) -> bytes:
+        return json_dumps(self.to_json())
+
     @classmethod
     def from_json(cls, json: dict) -> 'Block':
-        if json.get("id") == "block":
-            return CodeBlock.from_json(json)
-        elif json.get("id") == "bracket":
-            return Bracket.from_json(json)
-        else:
+        try:
+            from_json = _BLOCK_DISPATCH.get(json.get("id"))
+        except TypeError: # unhashable id
+            from_json = None
+        if from_json is None:
             if "id" in json:
                 raise MalformedCodeBlockJSONError("Unexpected value for 'id'.")
             else:
                 raise MalformedCodeBlockJSONError("No 'id' key present.")
 
+        return from_json(json)
+
 class Bracket(Block):
     """
     A bracket Block.
     """
+    __slots__ = ("open", "repeat")
+
     def __init__(self, open: bool, repeat: bool = False):
         self.open = open
         self.repeat = repeat
@@ -62,10 +116,14 @@ class Bracket(Block):
     def __repr__(self):
         return f"Bracket({self.open}, {self.repeat})"
 
+_RESERVED_KEYS = frozenset(("id", "block", "action", "target", "args"))
+
 class CodeBlock(Block):
     """
     Represents a Code Block.
     """
+    __slots__ = ("category", "action", "selection", "_args", "extras")
+
     def __init__(self, category: CodeBlockCategory, action: str = "", args: list[ItemValue] = None, selection: Selection = Selection.AUTO, **kwargs):
         """
         Initialize and creates a Code Block.
@@ -80,7 +138,7 @@ class CodeBlock(Block):
 
         :param category: The category the block is in.
         :param action: The action of the block.
-        :param args: List of arguments in the chest.
+        :param args: List of arguments in the chest. The list is copied, so later changes to it don't affect the block.
         :param selection: The targets the code block targets.
         :param kwargs: Extra data. See `Extra kwargs`.
         """
@@ -90,37 +148,45 @@ class CodeBlock(Block):
         self.args = args if args else []
         self.extras = kwargs
 
-    def __parse_values(self):
-        for index, value in enumerate(self.args.copy()):
-            if isinstance(value, (int, float)):
-                self.args[index] = Number(value)
-            elif isinstance(value, str):
-                self.args[index] = String(value)
-
-    def to_json(self) -> dict:
+    @property
+    def args(self) -> list[ItemValue]:
         """
-        Serializes the Code Block into JSON.
-        :return: The serialized JSON.
+        The arguments in the chest. Numbers and strings are converted to Number and String values as they are added.
+        Assigning a list copies it.
         """
-        self.__parse_values()
-        args_list = []
+        return self._args
+
+    @args.setter
+    def args(self, args: list[ItemValue]):
+        self._args = _ArgList(args)
+
+    def _args_json(self, as_bytes: bool) -> list:
+        # shared by to_json and _to_json_bytes, so both give every argument the same slot
+        args = self.args
+        action = self.action if self.action else "dynamic"
+        block = self.category.value
+        args_list = [None] * len(args)
         tags = 0
-        for index, item in enumerate(self.args):
-            convert = item.to_json(index)
+        for index, item in enumerate(args):
             if isinstance(item, BlockTag):
-                index = 26 - tags
-                convert = item.to_json(index)
+                data = item.to_json(26 - tags, action, block)
+                args_list[index] = json_dumps(data) if as_bytes else data
                 tags += 1
-                convert["item"]["data"]["action"] = self.action if self.action else "dynamic"
-                convert["item"]["data"]["block"] = self.category.value
+            else:
+                args_list[index] = item._to_json_bytes(index) if as_bytes else item.to_json(index)
 
-            args_list.append(convert)
+        return args_list
 
+    def to_json(self) -> dict:
+        """
+        Serializes the Code Block into JSON.
+        :return: The serialized JSON.
+        """
         data = {
             "id": "block",
             "block": self.category.value,
             "action": self.action,
-            "args": {"items": args_list}
+            "args": {"items": self._args_json(False)}
         }
 
         if self.selection != Selection.AUTO:
@@ -131,6 +197,18 @@ class CodeBlock(Block):
 
         return data
 
+    def _to_json_bytes(self) -> bytes:
+        if not _RESERVED_KEYS.isdisjoint(self.extras):
+            return json_dumps(self.to_json())
+
+        # same layout as to_json, with the already serialized arguments spliced in
+        head = json_dumps({"id": "block", "block": self.category.value, "action": self.action})
+        tail = self.extras if self.selection == Selection.AUTO else {"target": self.selection.value, **self.extras}
+        return b"".join((
+            head[:-1], b',"args":{"items":[', b",".join(self._args_json(True)), b"]}",
+            b"," + json_dumps(tail)[1:] if tail else b"}"
+        ))
+
     @classmethod
     def from_json(cls, json: dict) -> 'CodeBlock':
         """
@@ -148,16 +226,30 @@ class CodeBlock(Block):
             if json["block"] != "else" and "action" not in json:
                 raise MalformedCodeBlockJSONError("No 'action' key present.")
 
-        block = get_from_value(CodeBlockCategory, json["block"])
+        try:
+            block = _CATEGORY_BY_VALUE[json["block"]]
+        except (KeyError, TypeError): # unknown or unhashable value
+            raise MalformedCodeBlockJSONError("Unexpected value for 'block'.") from None
+        # the same few action names repeat across every block of a plot, so share one string object per name
         action = json.get("action", "")
-        target = get_from_value(Selection, json.get("target", ""))
-        args = [ItemValue.from_json(item) for item in json.get("args", {"items": []})["items"]]
-        code = cls(block, action, args, target)
-        for k, v in json:
-            if k not in ("block", "action", "target", "args"):
-                code.extras[k] = v
+        if isinstance(action, str):
+            action = sys.intern(action)
+        try:
+            target = _SELECTION_BY_VALUE[json.get("target", "")]
+        except (KeyError, TypeError):
+            raise MalformedCodeBlockJSONError("Unexpected value for 'target'.") from None
+        args_json = json.get("args")
+        code = cls(block, action, None, target)
+        if args_json:
+            code._args = _ArgList._from_item_values(map(ItemValue.from_json, args_json["items"]))
+        code.extras = {sys.intern(k): v for k, v in json.items() if k not in _RESERVED_KEYS}
 
         return code
 
     def __repr__(self):
         return f"CodeBlock({self.category.name}, \"{self.action}\", {self.args!r})"
+
+_BLOCK_DISPATCH = {
+    "block": CodeBlock.from_json,
+    "bracket": Bracket.from_json
+}
@@ -1,9 +1,17 @@
-from websockets.sync.client import connect
+import logging
+import socket
+from collections import deque
 from . import Template
-from .enums import Mode, PlotSize
+from .enums import Mode, PlotSize, _MODE_BY_VALUE
 from .exceptions import SendToMinecraftError
 from enum import Flag, auto
-from amulet_nbt import CompoundTag, from_snbt, ListTag
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import asyncio
+    from amulet_nbt import CompoundTag
+
+_log = logging.getLogger(__name__)
 
 class CCOutOfScopeError(Exception): pass
 class CCInvalidToken(Exception): pass
@@ -16,6 +24,34 @@ class CCAuthScopes(Flag):
     WRITE_CODE = auto()
     CLEAR_PLOT = auto()
 
+_NAME_TO_SCOPE = {
+    "inventory": CCAuthScopes.INVENTORY,
+    "movement": CCAuthScopes.MOVEMENT,
+    "read_plot": CCAuthScopes.READ_PLOT,
+    "write_code": CCAuthScopes.WRITE_CODE,
+    "clear_plot": CCAuthScopes.CLEAR_PLOT
+}
+_SCOPE_TO_NAME = {scope: name for name, scope in _NAME_TO_SCOPE.items()}
+
+def _ts_str(data: str) -> str:
+    return data
+
+_ts_bytes = bytes.decode
+
+def _inventory_snbt(items: 'list[CompoundTag | str]') -> str:
+    from amulet_nbt import CompoundTag, ListTag
+    # the type check below would otherwise consume a generator before it is serialized
+    items = list(items)
+    if all(isinstance(item, CompoundTag) for item in items):
+        # a single ListTag serializes the whole inventory in one amulet_nbt call
+        return ListTag(items).to_snbt()
+    return "[" + ",".join(item if isinstance(item, str) else item.to_snbt() for item in items) + "]"
+
+def _decompress_templates(data: str | bytes) -> list[Template]:
+    newline = b"\n" if isinstance(data, bytes) else "\n"
+    data = data.rstrip(newline)
+    return [Template.decompress(template) for template in data.split(newline)] if data else []
+
 class CodeClient:
     """
     API to interact with CodeClient.
@@ -36,7 +72,10 @@ class CodeClient:
         Opens a connection to communicate with CodeClient.
         :param timeout: The timeout in seconds for waiting on responses.
         """
-        self.socket = connect("ws://localhost:31375")
+        from websockets.sync.client import connect
+        # compression only costs CPU on a loopback connection, and plot scans can exceed the default frame size
+        self.socket = connect("ws://localhost:31375", compression=None, max_size=None)
+        self.socket.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.timeout = timeout
         self._scopes = CCAuthScopes.DEFAULT
         self.__method._api = self
@@ -68,22 +107,32 @@ class CodeClient:
         """
         self.socket.close()
 
-    @staticmethod
-    def _ts(data: str | bytes) -> str:
-        return data if isinstance(data, str) else data.decode()
+    def _ts(self, data: str | bytes) -> str:
+        # CodeClient always answers with the same frame type, so the converter is picked once on the first message
+        self._ts = _ts_str if isinstance(data, str) else _ts_bytes
+        return self._ts(data)
 
     def _recv(self) -> str:
         return self._ts(self.socket.recv(self.timeout))
 
+    def _recv_bytes(self) -> bytes:
+        return self.socket.recv(self.timeout, decode=False)
+
     class __method:
         _api: 'CodeClient' = None
         scope: CCAuthScopes = CCAuthScopes.DEFAULT
+        _needs_scope_check: bool = False
+        _scope_err: str = ""
+
+        def __init_subclass__(cls, **kwargs):
+            super().__init_subclass__(**kwargs)
+            # the scope is fixed per method class, so everything but the session check is resolved here
+            cls._needs_scope_check = CCAuthScopes.DEFAULT not in cls.scope
+            cls._scope_err = f"The action require scope {cls.scope.name}."
 
         def _require_scope(self):
-            if CCAuthScopes.DEFAULT in self.scope:
-                return
-            if not self.scope in self._api._scopes:
-                raise CCOutOfScopeError(f"The action require scope {self.scope.name}.")
+            if self._needs_scope_check and self.scope not in self._api._scopes:
+                raise CCOutOfScopeError(self._scope_err)
 
     class __give(__method):
         """
@@ -91,13 +140,13 @@ class CodeClient:
         """
         scope = CCAuthScopes.DEFAULT
 
-        def __call__(self, item: str | CompoundTag):
+        def __call__(self, item: 'str | CompoundTag'):
             """
             Sends an item (SNBT) to Minecraft.
             :param item: The ItemValue in SNBT or a Compound NBT Tag.
             :raises SendToMinecraftError: If the player is not in creative mode.
             """
-            if isinstance(item, CompoundTag):
+            if not isinstance(item, str):
                 item = item.to_snbt()
             self._api.socket.send("give " + item)
             try:
@@ -148,18 +197,9 @@ class CodeClient:
             """
             self._api.socket.send("scopes")
             message = self._api._recv()
-            scopes = message.split()
             new_scopes = CCAuthScopes.DEFAULT
-            if "inventory" in scopes:
-                new_scopes |= CCAuthScopes.INVENTORY
-            if "movement" in scopes:
-                new_scopes |= CCAuthScopes.MOVEMENT
-            if "read_plot" in scopes:
-                new_scopes |= CCAuthScopes.READ_PLOT
-            if "write_code" in scopes:
-                new_scopes |= CCAuthScopes.WRITE_CODE
-            if "clear_plot" in scopes:
-                new_scopes |= CCAuthScopes.CLEAR_PLOT
+            for name in message.split():
+                new_scopes |= _NAME_TO_SCOPE.get(name, CCAuthScopes.DEFAULT)
 
             self._api._scopes = new_scopes
             return new_scopes
@@ -171,17 +211,7 @@ class CodeClient:
             :param timeout: Timeout for player input in seconds.
             :raises TimeoutError: If the request times out.
             """
-            scope_list = []
-            if CCAuthScopes.INVENTORY in requested_scopes:
-                scope_list.append("inventory")
-            if CCAuthScopes.MOVEMENT in requested_scopes:
-                scope_list.append("movement")
-            if CCAuthScopes.READ_PLOT in requested_scopes:
-                scope_list.append("read_plot")
-            if CCAuthScopes.WRITE_CODE in requested_scopes:
-                scope_list.append("write_code")
-            if CCAuthScopes.CLEAR_PLOT in requested_scopes:
-                scope_list.append("clear_plot")
+            scope_list = [name for scope, name in _SCOPE_TO_NAME.items() if scope in requested_scopes]
             self._api.socket.send("scopes " + " ".join(scope_list))
             if "auth" in self._api._ts(self._api.socket.recv(timeout)):
                 self._api._scopes = requested_scopes
@@ -192,7 +222,7 @@ class CodeClient:
         """
         scope = CCAuthScopes.INVENTORY
 
-        def get(self) -> list[CompoundTag]:
+        def get(self) -> 'list[CompoundTag]':
             """
             Gets the player's inventory.
             :return: List of items in CompoundTag.
@@ -200,15 +230,12 @@ class CodeClient:
             """
             self._require_scope()
             self._api.socket.send("inv")
+            from amulet_nbt import from_snbt
             items = self._api._recv()
-            parsed: ListTag = from_snbt(items)
-            decoded: list[CompoundTag] = []
-            for item in parsed:
-                decoded.append(item)
-            
-            return decoded
+            parsed = from_snbt(items)
+            return list(parsed)
         
-        def set(self, items: list[CompoundTag | str]):
+        def set(self, items: 'list[CompoundTag | str]'):
             """
             Sets the player's inventory.
             :param items: List of item in SNBT or a Compound NBT Tag.
@@ -216,13 +243,7 @@ class CodeClient:
             """
             self._require_scope()
 
-            parsed = []
-            for item in items:
-                if isinstance(item, CompoundTag):
-                    item = item.to_snbt()
-                parsed.append(item)
-
-            self._api.socket.send("setinv [" + ",".join(parsed) + "]")
+            self._api.socket.send("setinv " + _inventory_snbt(items))
             try:
                 message = self._api._recv()
                 if message == "not creative mode":
@@ -257,13 +278,7 @@ class CodeClient:
             """
             self._require_scope()
             self._api.socket.send("mode")
-            mode = self._api._recv()
-            match mode:
-                case "spawn": return Mode.SPAWN
-                case "play": return Mode.PLAY
-                case "dev": return Mode.DEV
-                case "build": return Mode.BUILD
-
+            return _MODE_BY_VALUE.get(self._api._recv())
 
         def set(self, mode: Mode):
             """
@@ -288,11 +303,8 @@ class CodeClient:
             """
             self._require_scope()
             self._api.socket.send("scan")
-            data = self._api._recv()
-            templates = []
-            for template in data.split("\n"):
-                templates.append(Template.decompress(template))
-            return templates
+            # the scan is kept as raw bytes since Template.decompress takes them as-is
+            return _decompress_templates(self._api._recv_bytes())
 
 
         def get_size(self) -> PlotSize:
@@ -375,3 +387,269 @@ class CodeClient:
 
     def __repr__(self):
         return f"CodeClient({self.timeout})"
+
+class AsyncCodeClient:
+    """
+    Asynchronous API to interact with CodeClient.
+
+    CodeClient answers requests in the order they were sent, so several requests can be in flight at once
+    and awaited independently. Example::
+
+        async with AsyncCodeClient() as codeclient:
+            await codeclient.request_scopes(CCAuthScopes.MOVEMENT | CCAuthScopes.READ_PLOT)
+            mode, size = await asyncio.gather(codeclient.get_mode(), codeclient.get_size())
+
+    """
+    def __init__(self, timeout: float = 0.1):
+        """
+        Creates the client. The connection is opened by ``connect()`` or by entering ``async with``.
+        :param timeout: The timeout in seconds for waiting on responses.
+        """
+        self.socket = None
+        self.timeout = timeout
+        self._scopes = CCAuthScopes.DEFAULT
+        self._pending: 'deque[asyncio.Future]' = deque()
+        self._error_waiters: 'deque[asyncio.Future]' = deque()
+        self._reader_task: 'asyncio.Task | None' = None
+
+    async def connect(self):
+        """
+        Opens a connection to communicate with CodeClient.
+        """
+        import asyncio
+        from websockets.asyncio.client import connect
+        # asyncio already disables Nagle's algorithm on its TCP transports
+        self.socket = await connect("ws://localhost:31375", compression=None, max_size=None)
+        self._reader_task = asyncio.create_task(self._reader())
+
+    async def close(self):
+        """
+        Closes the internal socket.
+        """
+        if self.socket is None:
+            return
+        await self.socket.close()
+        if self._reader_task is not None:
+            await self._reader_task
+
+    async def __aenter__(self) -> 'AsyncCodeClient':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def have_scope(self, scope: CCAuthScopes) -> bool:
+        """
+        Checks if the current session have the scope.
+        :param scope: The scope to check for.
+        :return: Whether the scope is authorized or not.
+        """
+        return scope in self._scopes
+
+    def _require_scope(self, scope: CCAuthScopes):
+        if scope not in self._scopes:
+            raise CCOutOfScopeError(f"The action require scope {scope.name}.")
+
+    async def _reader(self):
+        from websockets.exceptions import ConnectionClosed
+        error = ConnectionError("The connection to CodeClient was closed.")
+        try:
+            async for message in self.socket:
+                message = message if isinstance(message, str) else message.decode()
+                # creative mode errors are only sent on failure, so they don't take part in the request order
+                if message == "not creative mode":
+                    if not self._error_waiters:
+                        _log.warning("Dropped a creative mode error for a send that is no longer waited for.")
+                        continue
+                    waiter = self._error_waiters.popleft()
+                elif self._pending:
+                    waiter = self._pending.popleft()
+                else:
+                    continue
+
+                if not waiter.done():
+                    waiter.set_result(message)
+        except ConnectionClosed as e:
+            error = e
+        finally:
+            for waiter in (*self._pending, *self._error_waiters):
+                if not waiter.done():
+                    waiter.set_exception(error)
+            self._pending.clear()
+            self._error_waiters.clear()
+
+    def _check_connected(self):
+        if self._reader_task is None or self._reader_task.done():
+            raise ConnectionError("Not connected to CodeClient.")
+
+    async def _request(self, command: str, timeout: float | None) -> str:
+        import asyncio
+        self._check_connected()
+        waiter = asyncio.get_running_loop().create_future()
+        # a timed out waiter keeps its place in the queue so the late response is discarded with it
+        self._pending.append(waiter)
+        await self.socket.send(command)
+        return await asyncio.wait_for(waiter, timeout)
+
+    async def _send_checked(self, command: str):
+        import asyncio
+        self._check_connected()
+        waiter = asyncio.get_running_loop().create_future()
+        self._error_waiters.append(waiter)
+        await self.socket.send(command)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except TimeoutError:
+            if waiter in self._error_waiters:
+                self._error_waiters.remove(waiter)
+            return
+        raise SendToMinecraftError("The player is not in creative mode.")
+
+    async def give(self, item: 'str | CompoundTag'):
+        """
+        Sends an item (SNBT) to Minecraft. Requires DEFAULT scope.
+        :param item: The ItemValue in SNBT or a Compound NBT Tag.
+        :raises SendToMinecraftError: If the player is not in creative mode.
+        """
+        if not isinstance(item, str):
+            item = item.to_snbt()
+        await self._send_checked("give " + item)
+
+    async def get_token(self) -> str:
+        """
+        Gets a token that is authenticated with the currently approved scopes. Requires DEFAULT scope.
+        :return: The token that can be used to authenticate with.
+        """
+        return await self._request("token", self.timeout)
+
+    async def authenticate(self, token: str):
+        """
+        Authenticates using the token. Requires DEFAULT scope.
+        :param token: The token attached to the scopes.
+        :raises CCInvalidToken: If the token is invalid.
+        """
+        message = await self._request("token " + token, self.timeout)
+        if message == "invalid token":
+            raise CCInvalidToken()
+        elif message == "auth":
+            await self.scopes()
+
+    async def scopes(self) -> CCAuthScopes:
+        """
+        Gets the list of scopes the program is authorized with. Requires DEFAULT scope.
+        :return: The list of scopes
+        """
+        message = await self._request("scopes", self.timeout)
+        new_scopes = CCAuthScopes.DEFAULT
+        for name in message.split():
+            new_scopes |= _NAME_TO_SCOPE.get(name, CCAuthScopes.DEFAULT)
+
+        self._scopes = new_scopes
+        return new_scopes
+
+    async def request_scopes(self, requested_scopes: CCAuthScopes, timeout: float = None):
+        """
+        Requests new scopes for the program and continues when the player runs /auth. Requires DEFAULT scope.
+        :param requested_scopes: The new scopes.
+        :param timeout: Timeout for player input in seconds.
+        :raises TimeoutError: If the request times out.
+        """
+        scope_list = [name for scope, name in _SCOPE_TO_NAME.items() if scope in requested_scopes]
+        if "auth" in await self._request("scopes " + " ".join(scope_list), timeout):
+            self._scopes = requested_scopes
+
+    async def get_inv(self) -> 'list[CompoundTag]':
+        """
+        Gets the player's inventory. Requires INVENTORY scope.
+        :return: List of items in CompoundTag.
+        :raises TimeoutError: If the request times out.
+        """
+        self._require_scope(CCAuthScopes.INVENTORY)
+        from amulet_nbt import from_snbt
+        parsed = from_snbt(await self._request("inv", self.timeout))
+        return list(parsed)
+
+    async def set_inv(self, items: 'list[CompoundTag | str]'):
+        """
+        Sets the player's inventory. Requires INVENTORY scope.
+        :param items: List of item in SNBT or a Compound NBT Tag.
+        :raises SendToMinecraftError: If the player is not in creative mode.
+        """
+        self._require_scope(CCAuthScopes.INVENTORY)
+        await self._send_checked("setinv " + _inventory_snbt(items))
+
+    async def spawn(self):
+        """
+        Moves the player to the codespace spawn. Requires MOVEMENT scope.
+        """
+        self._require_scope(CCAuthScopes.MOVEMENT)
+        self._check_connected()
+        await self.socket.send("spawn")
+
+    async def get_mode(self) -> Mode:
+        """
+        Gets the player's current mode. Requires MOVEMENT scope.
+        :return: The player's mode.
+        :raises TimeoutError: If the request times out.
+        """
+        self._require_scope(CCAuthScopes.MOVEMENT)
+        return _MODE_BY_VALUE.get(await self._request("mode", self.timeout))
+
+    async def set_mode(self, mode: Mode):
+        """
+        Sets the player's current mode. To confirm, use ``get_mode()`` again and compare. Requires MOVEMENT scope.
+        :param mode: The new mode to set to.
+        """
+        self._require_scope(CCAuthScopes.MOVEMENT)
+        self._check_connected()
+        await self.socket.send("mode " + mode.value)
+
+    async def get_templates(self) -> list[Template]:
+        """
+        Gets all templates of the plot. It's recommended to set a high timeout value for this. Requires READ_PLOT scope.
+        :return: The list of templates.
+        :raises TimeoutError: If the request times out.
+        """
+        self._require_scope(CCAuthScopes.READ_PLOT)
+        import asyncio
+        data = await self._request("scan", self.timeout)
+        return await asyncio.to_thread(_decompress_templates, data)
+
+    async def get_size(self) -> PlotSize:
+        """
+        Gets the current plot size. Requires READ_PLOT scope.
+        :return: The plot size.
+        :raises TimeoutError: If the request times out.
+        """
+        self._require_scope(CCAuthScopes.READ_PLOT)
+        return PlotSize(await self._request("size", self.timeout))
+
+    async def place(self, templates: list[Template], compact: bool = False, swap: bool = False):
+        """
+        Places the templates. Requires WRITE_CODE scope.
+        :param templates: The templates to place.
+        :param compact: Place the templates one after another with no space.
+        :param swap: Swap any preexisting templates, and place any ones which don't exist.
+        """
+        self._require_scope(CCAuthScopes.WRITE_CODE)
+        self._check_connected()
+        commands = ["place " + template.compress() for template in templates]
+        if compact:
+            await self.socket.send("place compact")
+        elif swap:
+            await self.socket.send("place swap")
+        for command in commands:
+            await self.socket.send(command)
+        await self.socket.send("place go")
+
+    async def clear_plot(self):
+        """
+        Clears the codespace. **USE WITH CAUTION** as this will remove all code. Requires CLEAR_PLOT scope.
+        """
+        self._require_scope(CCAuthScopes.CLEAR_PLOT)
+        self._check_connected()
+        await self.socket.send("clear")
+
+    def __repr__(self):
+        return f"AsyncCodeClient({self.timeout})"
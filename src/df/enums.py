@@ -1,9 +1,18 @@
 from enum import Enum, EnumType
 
 def get_from_value(enum: EnumType, value):
-    for member in enum:
-        if member.value == value:
-            return member
+    lookup = getattr(enum, "_lookup", None)
+    if lookup is not None:
+        try:
+            return lookup[value]
+        except (KeyError, TypeError): # missing or unhashable value
+            pass
+    else:
+        for member in enum:
+            if member.value == value:
+                return member
+
+    raise ValueError(f"{value!r} is not a valid {enum.__name__}.")
 
 class CodeBlockCategory(Enum):
     PLAYER_ACTION = "player_action"
@@ -72,3 +81,10 @@ class PlotSize(Enum):
     LARGE = "large"
     MASSIVE = "massive"
     MEGA = "mega"
+
+for _enum in (CodeBlockCategory, Selection, VariableScope, DataType, Mode, PlotSize):
+    _enum._lookup = {member.value: member for member in _enum}
+
+_CATEGORY_BY_VALUE = CodeBlockCategory._lookup
+_SELECTION_BY_VALUE = Selection._lookup
+_MODE_BY_VALUE = Mode._lookup
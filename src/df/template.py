@@ -1,15 +1,115 @@
-import json
 import base64
 import gzip
+import hashlib
+import logging
+import threading
+import zlib
+from binascii import b2a_base64
 
+from ._compat import json_dumps_ascii, json_loads
 from .code import Block, CodeBlock, CodeBlockCategory
 from .exceptions import MalformedTemplateJSONError, MalformedCodeBlockJSONError, SendToMinecraftError
-from amulet_nbt import CompoundTag, ByteTag, StringTag
+
+_log = logging.getLogger(__name__)
+
+_connections_lock = threading.Lock()
+_recode_conn = None
+_codeclient_conn = None
+
+def _is_open(sock) -> bool:
+    import socket
+    # a reused connection that Recode has closed reads as EOF without blocking
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return sock.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+def _recode_connection(timeout: float | None):
+    import socket
+    global _recode_conn
+    if _recode_conn is not None and not _is_open(_recode_conn):
+        _close_recode_connection()
+    if _recode_conn is None:
+        sock = socket.create_connection(("localhost", 31372), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _recode_conn = sock
+    return _recode_conn
+
+def _close_recode_connection():
+    global _recode_conn
+    if _recode_conn is not None:
+        _recode_conn.close()
+        _recode_conn = None
+
+def _codeclient_connection():
+    global _codeclient_conn
+    if _codeclient_conn is None:
+        import socket
+        from websockets.sync.client import connect
+        websocket = connect("ws://localhost:31375", compression=None, max_size=None)
+        websocket.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _codeclient_conn = websocket
+    return _codeclient_conn
+
+def _close_codeclient_connection():
+    global _codeclient_conn
+    if _codeclient_conn is not None:
+        _codeclient_conn.close()
+        _codeclient_conn = None
+
+def _drain(websocket):
+    # drops responses to earlier sends that only arrived after their timeout
+    # recv(0) only returns already queued frames since websockets 15, 14.0 and 14.1 time out before checking
+    try:
+        while True:
+            message = websocket.recv(0)
+            message = message if isinstance(message, str) else message.decode()
+            if message == "not creative mode":
+                _log.warning("An earlier template was not given: the player is not in creative mode.")
+            else:
+                _log.debug("Dropped a late CodeClient response: %s", message)
+    except TimeoutError:
+        pass
+
+def _snbt_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+_MAX_CODE_LENGTH = 65535
+# the largest GZIP output whose Base64 encoding still fits into _MAX_CODE_LENGTH
+_MAX_GZIP_LENGTH = _MAX_CODE_LENGTH // 4 * 3
+
+# the JSON is fed to zlib in large chunks, so an oversized template is given up on early without many small calls
+_GZIP_CHUNK_SIZE = 1 << 18
+
+def _gzip_json(data: bytes, level: int) -> bytes | None:
+    compressor = zlib.compressobj(level, wbits=31) # GZIP container
+    view = memoryview(data)
+    parts = []
+    size = 0
+    for start in range(0, len(data), _GZIP_CHUNK_SIZE):
+        part = compressor.compress(view[start:start + _GZIP_CHUNK_SIZE])
+        size += len(part)
+        # compressed output only grows, so stop as soon as it can no longer fit
+        if size > _MAX_GZIP_LENGTH:
+            return None
+        parts.append(part)
+
+    parts.append(compressor.flush())
+    compressed = b"".join(parts)
+    return compressed if len(compressed) <= _MAX_GZIP_LENGTH else None
 
 class Template:
     """
     Marks a DiamondFire Template.
     """
+    __slots__ = ("codeblocks", "name", "_compressed_cache")
+
     def __init__(self, codeblocks: list[Block], name: str = None):
         """
         Creates a new Template object.
@@ -18,6 +118,7 @@ class Template:
         """
         self.codeblocks = codeblocks
         self.name = name
+        self._compressed_cache: tuple[bytes, int, str] | None = None
 
     def __add__(self, code: Block | list[Block]) -> 'Template':
         """
@@ -25,42 +126,56 @@ class Template:
         :param code: The new block(s) to add.
         :return: The changed Template.
         """
+        codeblocks = list(self.codeblocks)
         if isinstance(code, Block):
-            code = [code]
+            codeblocks.append(code)
+        else:
+            codeblocks.extend(code)
 
-        return Template(self.codeblocks + [*code])
+        return Template(codeblocks)
 
-    def __iadd__(self, code: Block | list[Block]):
+    def __iadd__(self, code: Block | list[Block]) -> 'Template':
         """
         Adds the code to the end of the blocks.
         :param code: The new block(s) to add.
+        :return: The same Template.
         """
         if isinstance(code, Block):
-            code = [code]
+            self.codeblocks.append(code)
+        else:
+            self.codeblocks.extend(code)
 
-        self.codeblocks.extend(code)
+        return self
 
     def to_json(self) -> dict:
         """
         Serializes the Template into a JSON object.
         :return: The serialized JSON.
         """
-        blocks = []
-        for block in self.codeblocks:
-            blocks.append(block.to_json())
-
-        return {"blocks": blocks}
+        return {"blocks": [block.to_json() for block in self.codeblocks]}
 
-    def compress(self) -> str:
+    def compress(self, level: int = 1) -> str:
         """
         Compresses the template into a single Base64 GZIP string.
+        :param level: The GZIP compression level. If the output is too long, level 9 is tried before giving up.
         :return: The compressed string.
         :raises OverflowError: If the output is way too long.
         """
-        compressed = base64.b64encode(gzip.compress(json.dumps(self.to_json()).encode())).decode()
-        if len(compressed) > 65535:
-            raise OverflowError(f"Compressed data too large: {len(compressed)} / 65535")
+        data = b'{"blocks":[' + b",".join([block._to_json_bytes() for block in self.codeblocks]) + b"]}"
+        # blocks can be changed in place, so the cache is keyed by a digest of the JSON rather than a version
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        cache = self._compressed_cache
+        if cache is not None and cache[0] == digest and cache[1] == level:
+            return cache[2]
 
+        gzipped = _gzip_json(data, level)
+        if gzipped is None and level < 9:
+            gzipped = _gzip_json(data, 9)
+        if gzipped is None:
+            raise OverflowError(f"Compressed data too large: over {_MAX_CODE_LENGTH} characters")
+
+        compressed = b2a_base64(gzipped, newline=False).decode("ascii")
+        self._compressed_cache = (digest, level, compressed)
         return compressed
 
     @classmethod
@@ -92,7 +207,7 @@ class Template:
         if isinstance(data, str):
             data = data.encode()
 
-        decompressed = json.loads(gzip.decompress(base64.b64decode(data)).decode())
+        decompressed = json_loads(gzip.decompress(base64.b64decode(data)))
         return cls.from_json(decompressed)
 
     def __get_name(self) -> str:
@@ -119,83 +234,94 @@ class Template:
         else:
             return "§bCode Template"
 
-    @staticmethod
-    def __make_safe(string: str) -> str:
-        return string.translate(str.maketrans({
-            '"': '\\"',
-            "'": "\\'",
-            "\\": "\\\\",
-            "\n": "\\n",
-            "\r": "\\r",
-            "\t": "\\t",
-            "\b": "\\b",
-            "\f": "\\f"
-        }))
-
     def __get_as_item(self, author: str) -> str:
-        return CompoundTag({
-            "Count": ByteTag(1),
-            "id": StringTag("ender_chest"),
-            "tag": CompoundTag({
-                "display": CompoundTag({
-                    "Name": StringTag(json.dumps({"italic": False, "text": self.__get_name()}))
-                }),
-                "PublicBukkitValues": CompoundTag({
-                    "hypercube:codetemplatedata": StringTag(json.dumps({
-                        "version": 1,
-                        "author": author,
-                        "name": self.__get_name(),
-                        "code": self.compress()
-                    }))
-                })
-            })
-        }).to_snbt()
-
-    def send_to_recode(self, source: str = "DiamondFire.py", author: str = "DiamondFire.py"):
-        """
-        Sends the Template to Minecraft via (Deprecated) Recode.
+        # the item always has the same shape, so the SNBT is written directly instead of through amulet_nbt
+        name = self.__get_name()
+        display_name = json_dumps_ascii({"italic": False, "text": name})
+        template_data = json_dumps_ascii({
+            "version": 1,
+            "author": author,
+            "name": name,
+            "code": self.compress()
+        })
+        return (
+            '{Count:1b,id:"ender_chest",tag:{display:{Name:' + _snbt_string(display_name) + '},'
+            'PublicBukkitValues:{"hypercube:codetemplatedata":' + _snbt_string(template_data) + '}}}'
+        )
+
+    def send_to_recode(self, source: str = "DiamondFire.py", author: str = "DiamondFire.py", timeout: float | None = 5):
+        """
+        Sends the Template to Minecraft via (Deprecated) Recode. The connection is kept open for later sends.
         :param source: The name of the program. This is displayed in the toast.
         :param author: The author of the Template.
+        :param timeout: The timeout in seconds for connecting and waiting on the response.
         :raises SendToMinecraftError: If the sending failed for some reason.
+        :raises TimeoutError: If Recode does not respond in time.
         """
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            sock.connect(("localhost", 31372))
-
-            data = json.dumps({
-                "type": "nbt",
-                "data": self.__get_as_item(author),
-                "source": source
-            })
-            sock.send((data + "\n").encode())
+        payload = (json_dumps_ascii({
+            "type": "nbt",
+            "data": self.__get_as_item(author),
+            "source": source
+        }) + "\n").encode()
 
-            receive = sock.recv(1024)
-            status = json.loads(receive.decode())
-            if status["status"] == "error":
-                raise SendToMinecraftError(status["error"])
+        with _connections_lock:
+            # once the payload is sent, a failure is not retried since Recode may have already placed the template
+            sock = _recode_connection(timeout)
+            try:
+                # the kept connection must not block forever while the lock is held
+                sock.settimeout(timeout)
+                sock.sendall(payload)
+                receive = sock.recv(1024)
+                if not receive:
+                    raise ConnectionResetError("Recode closed the connection.")
+            except OSError:
+                _close_recode_connection()
+                raise
 
-        finally:
-            sock.close()
+        status = json_loads(receive)
+        if status["status"] == "error":
+            raise SendToMinecraftError(status["error"])
 
-    def send_to_codeclient(self, author: str = "DiamondFire.py", timeout: int = 0.1):
+    def send_to_codeclient(self, author: str = "DiamondFire.py", timeout: float | None = 0.1):
         """
-        Sends the Template to Minecraft via CodeClient.
+        Sends the Template to Minecraft via CodeClient. The connection is kept open for later sends.
         :param author: The author of the Template.
-        :param timeout: The timeout in seconds for waiting on responses.
+        :param timeout: The timeout in seconds for waiting on responses. If None, the response is not waited for, and a late error is logged on the next send.
         :raises SendToMinecraftError: If the player is not in creative mode.
         """
-        from websockets.sync.client import connect
-        socket = connect("ws://localhost:31375")
+        from websockets.exceptions import ConnectionClosed
+        data = "give " + self.__get_as_item(author)
 
-        # copied from codeclient.py due to circular import
-        socket.send("give " + self.__get_as_item(author))
-        try:
-            message = socket.recv(timeout)
-            message = message if isinstance(message, str) else message.decode()
-            if message == "not creative mode":
-                raise SendToMinecraftError("The player is not in creative mode.")
-        except TimeoutError:
-            pass
-        finally:
-            socket.close()
+        with _connections_lock:
+            for attempt in range(2):
+                websocket = _codeclient_connection()
+                try:
+                    _drain(websocket)
+                    websocket.send(data)
+                    break
+                except ConnectionClosed:
+                    _close_codeclient_connection()
+                    if attempt:
+                        raise
+
+            # a late response is dropped by the drain before the next send
+            if timeout is None:
+                return
+
+            # copied from codeclient.py due to circular import
+            try:
+                message = websocket.recv(timeout)
+                message = message if isinstance(message, str) else message.decode()
+                if message == "not creative mode":
+                    raise SendToMinecraftError("The player is not in creative mode.")
+            except TimeoutError:
+                pass
+
+    @classmethod
+    def close_connections(cls):
+        """
+        Closes the connections kept open by ``send_to_recode`` and ``send_to_codeclient``.
+        """
+        with _connections_lock:
+            _close_recode_connection()
+            _close_codeclient_connection()
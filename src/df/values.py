@@ -1,11 +1,23 @@
+from ._compat import json_dumps
 from .exceptions import MalformedItemJSONError
 from .enums import VariableScope, Selection, DataType, get_from_value
-from amulet_nbt import CompoundTag, from_snbt
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from amulet_nbt import CompoundTag
+
+def _enum_from_json(enum, value, key: str):
+    try:
+        return get_from_value(enum, value)
+    except ValueError as e:
+        raise MalformedItemJSONError(f"Unexpected value for 'item.data.{key}'.") from e
 
 class ItemValue:
     """
     Base ItemValue class. You shouldn't use this.
     """
+    __slots__ = ("id", "slot")
+
     def __init__(self, id: str, slot: int = -1):
         self.id = id
         self.slot = slot
@@ -26,6 +38,9 @@ class ItemValue:
             "slot": index if self.slot == -1 else self.slot
         }
 
+    def _to_json_bytes(self, index: int = 0) -> bytes:
+        return json_dumps(self.to_json(index))
+
     @classmethod
     def from_json(cls, json: dict) -> 'ItemValue':
         """
@@ -33,81 +48,84 @@ class ItemValue:
         :param json: The JSON object.
         :return: The ItemValue object.
         """
-        if "slot" not in json:
-            raise MalformedItemJSONError("No 'slot' key present.")
-        if "item" not in json:
-            raise MalformedItemJSONError("No 'item' key present.")
-
-        if not isinstance(json["slot"], int):
+        # the keys are read directly, so well-formed items don't pay for a membership test per key
+        try:
+            slot = json["slot"]
+            item = json["item"]
+        except KeyError as e:
+            raise MalformedItemJSONError(f"No '{e.args[0]}' key present.") from None
+        except TypeError:
+            raise MalformedItemJSONError("Item is not a dict.") from None
+
+        if not isinstance(slot, int):
             raise MalformedItemJSONError("Unexpected value for 'slot'.")
-        if not isinstance(json["item"], dict):
+        if not isinstance(item, dict):
             raise MalformedItemJSONError("Unexpected value for 'item'.")
 
-        if "id" not in json["item"]:
-            raise MalformedItemJSONError("No 'item.id' key present.")
-        if "data" not in json["item"]:
-            raise MalformedItemJSONError("No 'item.data' key present.")
-
-        class_lookup = {
-            "txt": String,
-            "comp": Text,
-            "num": Number,
-            "var": Variable,
-            "g_val": GameValue,
-            "loc": Location,
-            "vec": Vector,
-            "snd": Sound,
-            "part": Particle,
-            "pot": Potion,
-            "pn_el": Parameter, # AKA Pattern Element
-            "bl_tag": BlockTag,
-            "item": Item # Actual Minecraft item
-        }
-        if json["item"]["id"] in class_lookup:
-            return class_lookup[json["item"]["id"]].from_json(json["item"]["data"], json["slot"])
-        raise MalformedItemJSONError("Unexpected value for 'item.id'.")
+        try:
+            item_id = item["id"]
+            data = item["data"]
+        except KeyError as e:
+            raise MalformedItemJSONError(f"No 'item.{e.args[0]}' key present.") from None
+
+        try:
+            item_class = _ITEM_CLASSES[item_id]
+        except (KeyError, TypeError): # unknown or unhashable id
+            raise MalformedItemJSONError("Unexpected value for 'item.id'.") from None
+
+        return item_class.from_json(data, slot)
+
+class _NameValue(ItemValue):
+    """
+    Base class of the values whose data is only a name. You shouldn't use this.
+    """
+    __slots__ = ("value",)
+    _JSON_FMT = b'{"item":{"id":%s,"data":{"name":%s}},"slot":%d}'
+
+    def _getdata(self) -> dict:
+        return {"name": self.value}
 
-class String(ItemValue):
+    def _to_json_bytes(self, index: int = 0) -> bytes:
+        return self._JSON_FMT % (json_dumps(self.id), json_dumps(self.value), index if self.slot == -1 else self.slot)
+
+class String(_NameValue):
     """
     A String value.
     """
+    __slots__ = ()
+
     def __init__(self, value: str, slot: int = -1):
         super().__init__("txt", slot)
         self.value = value
 
-    def _getdata(self) -> dict:
-        return {"name": self.value}
-
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'String':
         return cls(json["name"], slot)
 
-class Text(ItemValue):
+class Text(_NameValue):
     """
     A Styled Text value.
     """
+    __slots__ = ()
+
     def __init__(self, value: str, slot: int = -1):
         super().__init__("comp", slot)
         self.value = value
 
-    def _getdata(self) -> dict:
-        return {"name": self.value}
-
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'Text':
         return cls(json["name"], slot)
 
-class Number(ItemValue):
+class Number(_NameValue):
     """
     A Number value.
     """
+    __slots__ = ()
+
     def __init__(self, value: str | float | int, slot: int = -1):
         super().__init__("num", slot)
         self.value = value
 
-    def _getdata(self) -> dict:
-        return {"name": self.value}
-
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'Number':
         return cls(json["name"], slot)
@@ -116,6 +134,8 @@ class Location(ItemValue):
     """
     A Location value.
     """
+    __slots__ = ("x", "y", "z", "pitch", "yaw")
+
     def __init__(self, x: float, y: float, z: float, pitch: float = 0, yaw: float = 0, slot: int = -1):
         super().__init__("loc", slot)
         self.x = x
@@ -144,6 +164,8 @@ class Vector(ItemValue):
     """
     A Vector value.
     """
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float, y: float, z: float, slot: int = -1):
         super().__init__("vec", slot)
         self.x = x
@@ -165,6 +187,8 @@ class Sound(ItemValue):
     """
     A Sound value. It may be a custom resourcepack sound.
     """
+    __slots__ = ("sound", "pitch", "volume", "custom")
+
     def __init__(self, sound: str, pitch: float = 1, volume: float = 2, custom_sound: bool = False, slot: int = -1):
         super().__init__("snd", slot)
         self.sound = sound
@@ -198,6 +222,8 @@ class ParticleData:
     """
     Data relating to particles.
     """
+    __slots__ = ("color", "color_variation", "fade_color", "size", "size_variation", "motion", "motion_variation", "material", "roll")
+
     def __init__(self, *,
                  color: int = 0xFF0000, color_variation: float = 0, fade_color: int = 0x000000,
                  size: float = 1, size_variation: float = 0,
@@ -242,6 +268,8 @@ class Particle(ItemValue):
     """
     A Particle value. This is by far the most complex value type. Use ``ParticleData`` also for more complex particle creation.
     """
+    __slots__ = ("particle", "amount", "spread", "data")
+
     def __init__(self, particle: str, spread: tuple[float, float], amount: int, data: ParticleData, slot: int = -1):
         super().__init__("part", slot)
         self.particle = particle
@@ -268,6 +296,8 @@ class Potion(ItemValue):
     """
     A Potion value.
     """
+    __slots__ = ("effect", "duration", "amplifier")
+
     def __init__(self, effect: str, duration: int = -1, amplifier: int = 1, slot: int = -1):
         super().__init__("pot", slot)
         self.effect = effect
@@ -285,38 +315,63 @@ class Variable(ItemValue):
     """
     A Variable value.
     """
+    __slots__ = ("name", "_scope", "_scope_value")
+
     def __init__(self, name: str, scope: VariableScope = VariableScope.GAME, slot: int = -1):
         super().__init__("var", slot)
         self.name = name
         self.scope = scope
 
+    @property
+    def scope(self) -> VariableScope:
+        return self._scope
+
+    @scope.setter
+    def scope(self, scope: VariableScope):
+        # the raw value is kept next to the enum so serializing skips the Enum.value descriptor
+        self._scope = scope
+        self._scope_value = scope.value
+
     def _getdata(self) -> dict:
-        return {"name": self.name, "scope": self.scope.value}
+        return {"name": self.name, "scope": self._scope_value}
 
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'Variable':
-        return cls(json["name"], get_from_value(VariableScope, json["scope"]), slot)
+        return cls(json["name"], _enum_from_json(VariableScope, json["scope"], "scope"), slot)
 
 class GameValue(ItemValue):
     """
     A Game Value item.
     """
+    __slots__ = ("type", "_selection", "_selection_value")
+
     def __init__(self, type: str, selection: Selection = Selection.DEFAULT, slot: int = -1):
         super().__init__("g_val", slot)
         self.type = type
         self.selection = selection
 
+    @property
+    def selection(self) -> Selection:
+        return self._selection
+
+    @selection.setter
+    def selection(self, selection: Selection):
+        self._selection = selection
+        self._selection_value = selection.value
+
     def _getdata(self) -> dict:
-        return {"type": self.type, "target": self.selection.value}
+        return {"type": self.type, "target": self._selection_value}
 
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'GameValue':
-        return cls(json["type"], get_from_value(Selection, json["target"]), slot)
+        return cls(json["type"], _enum_from_json(Selection, json["target"], "target"), slot)
 
 class Parameter(ItemValue):
     """
     A Pattern Element (AKA Parameter) value. This is the 2nd most complex value.
     """
+    __slots__ = ("name", "_type", "_type_value", "plural", "default", "description", "note")
+
     def __init__(self, name: str, type: DataType, plural: bool = False, default: ItemValue = None, description: str = None, note: str = None, slot: int = -1):
         super().__init__("pn_el", slot)
         self.name = name
@@ -326,10 +381,19 @@ class Parameter(ItemValue):
         self.description = description
         self.note = note
 
+    @property
+    def type(self) -> DataType:
+        return self._type
+
+    @type.setter
+    def type(self, type: DataType):
+        self._type = type
+        self._type_value = type.value
+
     def _getdata(self) -> dict:
         data = {
             "name": self.name,
-            "type": self.type.value,
+            "type": self._type_value,
             "plural": self.plural,
             "optional": self.default is None
         }
@@ -344,19 +408,40 @@ class Parameter(ItemValue):
 
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'Parameter':
-        return cls(json["name"], get_from_value(DataType, json["type"]), json["plural"], None if not json["optional"] else ItemValue.from_json({"item": json["default_value"], "slot": -1}), json.get("description"), json.get("note"), slot)
+        return cls(json["name"], _enum_from_json(DataType, json["type"], "type"), json["plural"], None if not json["optional"] else ItemValue.from_json({"item": json["default_value"], "slot": -1}), json.get("description"), json.get("note"), slot)
 
 class BlockTag(ItemValue):
     """
     A BlockTag meta-value.
     """
+    __slots__ = ("tag", "option")
+
     def __init__(self, tag: str, option: str):
         super().__init__("bl_tag", 0)
         self.tag = tag
         self.option = option
 
-    def _getdata(self) -> dict:
-        return {"option": self.option, "tag": self.tag}
+    def to_json(self, index: int = 0, action: str = None, block: str = None) -> dict:
+        """
+        Serialize the BlockTag into JSON.
+        :param index: The slot of the tag.
+        :param action: The action of the Code Block the tag belongs to. Left out if not given.
+        :param block: The category value of the Code Block the tag belongs to. Left out if not given.
+        :return: The serialized JSON.
+        """
+        data = {"option": self.option, "tag": self.tag}
+        if action is not None:
+            data["action"] = action
+        if block is not None:
+            data["block"] = block
+
+        return {
+            "item": {
+                "id": self.id,
+                "data": data
+            },
+            "slot": index if self.slot == -1 else self.slot
+        }
 
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'BlockTag':
@@ -366,7 +451,9 @@ class Item(ItemValue):
     """
     A Minecraft item.
     """
-    def __init__(self, item: CompoundTag, slot: int = -1):
+    __slots__ = ("item",)
+
+    def __init__(self, item: 'CompoundTag', slot: int = -1):
         super().__init__("item", slot)
         self.item = item
 
@@ -375,4 +462,21 @@ class Item(ItemValue):
 
     @classmethod
     def from_json(cls, json: dict, slot: int = -1) -> 'Item':
+        from amulet_nbt import from_snbt
         return cls(from_snbt(json["item"]), slot)
+
+_ITEM_CLASSES = {
+    "txt": String,
+    "comp": Text,
+    "num": Number,
+    "var": Variable,
+    "g_val": GameValue,
+    "loc": Location,
+    "vec": Vector,
+    "snd": Sound,
+    "part": Particle,
+    "pot": Potion,
+    "pn_el": Parameter, # AKA Pattern Element
+    "bl_tag": BlockTag,
+    "item": Item # Actual Minecraft item
+}